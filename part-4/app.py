@@ -5,7 +5,7 @@ Build a JSON API for database operations (used by frontend apps, mobile apps, et
 
 What You'll Learn:
 - REST API concepts (GET, POST, PUT, DELETE)
-- JSON responses with jsonify
+- JSON responses with jsonify (and a faster orjson-based variant)
 - API error handling
 - Status codes
 - Testing APIs with curl or Postman
@@ -13,45 +13,316 @@ What You'll Learn:
 Prerequisites: Complete part-3 (SQLAlchemy)
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, stream_with_context
+from flask_compress import Compress  # gzip/brotli responses (pip install flask-compress)
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from datetime import datetime, timezone
+from math import ceil
+from typing import Annotated, Optional, Union
+import base64
+import gzip
+import hashlib
+import sqlite3
+import brotli
+import msgspec  # Typed structs with a fast JSON encoder (pip install msgspec)
+import orjson  # Fast JSON library (pip install orjson)
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///api_demo.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool shared by the worker threads (see "RUNNING IN PRODUCTION" below).
+# In-memory SQLite (e.g. 'sqlite://' in tests) uses a single shared connection
+# with no pool, so these options don't apply there.
+_db_uri = app.config['SQLALCHEMY_DATABASE_URI']
+if _db_uri not in ('sqlite://', 'sqlite:///:memory:') and 'mode=memory' not in _db_uri:
+    engine_options = {'pool_size': 20}  # Connections kept open, at least one per thread
+    if not _db_uri.startswith('sqlite'):
+        # Server connections can be dropped by the network or the server; SQLite
+        # files can't, so there a ping would just be an extra SELECT 1 per request
+        engine_options['pool_pre_ping'] = True  # Check connection validity before using
+        engine_options['pool_recycle'] = 3600   # Recycle connections after 1 hour
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+# Compress JSON and HTML responses for clients that send Accept-Encoding
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 4     # gzip level
+app.config['COMPRESS_BR_LEVEL'] = 4  # brotli quality
+
 db = SQLAlchemy(app)
+Compress(app)
+
+
+# Faster SQLite writes: WAL journaling with synchronous=NORMAL only fsyncs at
+# checkpoints instead of on every commit, and mmap lets reads skip syscalls
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_conn, _connection_record):
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return  # Only applies to SQLite
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')  # 256 MB
+    cursor.close()
+
+
+# =============================================================================
+# FAST JSON RESPONSES
+# =============================================================================
+
+# orjson serializes datetime natively (no isoformat() per row); naive datetimes
+# are treated as UTC and UTC is written as "...Z"
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+class ORJSONResponse(Response):
+    default_mimetype = 'application/json'
+
+
+def ojsonify(payload, status=200):  # Drop-in replacement for jsonify()
+    return ORJSONResponse(orjson.dumps(payload, option=ORJSON_OPTIONS), status=status)
+
+
+# List responses always start the same way, so those bytes are built only once
+_BOOKS_PREFIX = b'{"success":true,"books":'
+_BOOKS_ENCODER = msgspec.json.Encoder()  # Encodes lists of BookOut structs (see MODELS)
+
+
+def books_jsonify(books, **fields):  # Like ojsonify({'success': True, 'books': books, **fields})
+    body = _BOOKS_PREFIX + _BOOKS_ENCODER.encode(books)
+    if fields:
+        body += b',' + orjson.dumps(fields, option=ORJSON_OPTIONS)[1:]  # Drop the '{' and append
+    else:
+        body += b'}'
+    return ORJSONResponse(body)
 
 
 # =============================================================================
 # MODELS
 # =============================================================================
 
+def utcnow():  # Timezone-aware replacement for the deprecated datetime.utcnow()
+    return datetime.now(timezone.utc)
+
+
+class UTCDateTime(db.TypeDecorator):  # Stores UTC, reads back timezone-aware UTC datetimes
+    impl = db.DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):  # SQLite returns naive datetimes
+        if value is not None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(100), nullable=False)
     year = db.Column(db.Integer)
-    isbn = db.Column(db.String(20), unique=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    isbn = db.Column(db.String(20), unique=True, index=True)  # Unique index 'ix_book_isbn'
+    created_at = db.Column(UTCDateTime, default=utcnow)
+    updated_at = db.Column(UTCDateTime, default=utcnow, onupdate=utcnow, index=True)
 
-    def to_dict(self):  # Convert model to dictionary for JSON response
+    def to_dict(self):  # Convert model to dictionary for JSON response (write endpoints only)
         return {
             'id': self.id,
             'title': self.title,
             'author': self.author,
             'year': self.year,
             'isbn': self.isbn,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at,  # orjson formats datetime itself
+            'updated_at': self.updated_at
         }
 
 
+# Columns the API is allowed to sort by (looked up once, not on every request)
+SORTABLE_COLUMNS = {
+    'id': Book.id,
+    'title': Book.title,
+    'author': Book.author,
+    'year': Book.year,
+    'isbn': Book.isbn,
+    'created_at': Book.created_at,
+}
+
+
+# Book as returned by the list endpoints. A msgspec Struct is much cheaper to
+# create than a dict and msgspec encodes it to JSON directly.
+class BookOut(msgspec.Struct):
+    id: int
+    title: str
+    author: str
+    year: Optional[int]
+    isbn: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+
+# Columns returned by the read endpoints, in BookOut field order so a row can be
+# passed straight to BookOut(*row). Selecting plain table columns (instead of Book
+# objects) skips building a model instance and a to_dict() per row.
+BOOK_COLS = tuple(Book.__table__.c[name] for name in BookOut.__struct_fields__)
+
+
+# Request bodies for POST and PUT. msgspec parses the JSON and checks the fields
+# (required, types, non-empty strings) in a single pass over the raw bytes.
+NonEmptyStr = Annotated[str, msgspec.Meta(min_length=1)]
+
+
+class BookIn(msgspec.Struct):  # POST /api/books
+    title: NonEmptyStr
+    author: NonEmptyStr
+    year: Optional[int] = None
+    isbn: Optional[str] = None
+
+
+class BookPatch(msgspec.Struct):  # PUT /api/books/<id>: fields left out stay UNSET
+    title: Union[NonEmptyStr, msgspec.UnsetType] = msgspec.UNSET
+    author: Union[NonEmptyStr, msgspec.UnsetType] = msgspec.UNSET
+    year: Union[Optional[int], msgspec.UnsetType] = msgspec.UNSET
+    isbn: Union[Optional[str], msgspec.UnsetType] = msgspec.UNSET
+
+
+BOOK_IN_DECODER = msgspec.json.Decoder(BookIn)
+BOOK_PATCH_DECODER = msgspec.json.Decoder(BookPatch)
+
+
+# =============================================================================
+# FULL-TEXT SEARCH INDEX (SQLite FTS5)
+# =============================================================================
+# LIKE '%python%' has to scan every row. FTS5 with the trigram tokenizer indexes
+# every 3-character slice of the text, so the same substring search goes through
+# an index instead. Triggers keep the index in sync with the book table, and
+# table events create/drop the index together with the book table itself.
+
+# The trigram tokenizer needs SQLite 3.34+; anything else keeps using LIKE
+USE_FTS = (app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+           and sqlite3.sqlite_version_info >= (3, 34, 0))
+
+BOOK_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "title, author, content='book', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_insert AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_delete AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_update AFTER UPDATE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+)
+
+book_fts = db.table('book_fts', db.column('rowid'), db.column('title'), db.column('author'))  # For queries only
+
+
+def fts_filter(column, fts_column, text):  # Substring filter, through the FTS index when possible
+    if USE_FTS and len(text) >= 3:  # Trigrams need at least 3 characters
+        phrase = '"' + text.replace('"', '""') + '"'  # Quoted, so FTS5 treats it as plain text
+        return Book.id.in_(db.select(book_fts.c.rowid).where(fts_column.match(phrase)))
+    return column.ilike(f'%{text}%')  # Case-insensitive LIKE
+
+
+def build_search_index(connection):
+    for statement in BOOK_FTS_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql("INSERT INTO book_fts(book_fts) VALUES ('rebuild')")  # Index existing rows
+
+
+@event.listens_for(Book.__table__, 'after_create')  # Runs whenever create_all() creates 'book'
+def _create_search_index(target, connection, **kw):
+    if USE_FTS:
+        connection.exec_driver_sql('DROP TABLE IF EXISTS book_fts')  # Stale index of an older 'book'
+        build_search_index(connection)
+
+
+@event.listens_for(Book.__table__, 'before_drop')  # Runs whenever drop_all() drops 'book'
+def _drop_search_index(target, connection, **kw):
+    if USE_FTS:
+        connection.exec_driver_sql('DROP TABLE IF EXISTS book_fts')
+
+
+def create_search_index():  # For databases whose 'book' table existed before the index did
+    if USE_FTS and not db.inspect(db.engine).has_table('book_fts'):
+        with db.engine.begin() as connection:
+            build_search_index(connection)
+
+
+# =============================================================================
+# KEYSET (CURSOR) PAGINATION HELPERS
+# =============================================================================
+# OFFSET pagination makes the database read and throw away every skipped row,
+# so page 1000 is much slower than page 1. Keyset pagination remembers the last
+# row we sent and asks for rows "after" it, which costs the same at any depth.
+
+def encode_cursor(sort_column, desc, book):  # Opaque token pointing at the last book sent
+    raw = orjson.dumps([sort_column, 'desc' if desc else 'asc', getattr(book, sort_column), book.id],
+                       option=ORJSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):  # Raises ValueError/TypeError on a bad (or tampered) token
+    sort_column, direction, last_value, last_id = orjson.loads(base64.urlsafe_b64decode(cursor))
+    # Only plain JSON scalars may reach the database as the keyset value
+    if isinstance(last_value, bool) or not isinstance(last_value, (type(None), str, int, float)):
+        raise ValueError('Invalid cursor value')
+    if isinstance(last_id, bool) or not isinstance(last_id, int) or direction not in ('asc', 'desc'):
+        raise ValueError('Invalid cursor')
+    if sort_column == 'created_at' and last_value is not None:
+        if not isinstance(last_value, str):
+            raise ValueError('Invalid cursor value')
+        last_value = datetime.fromisoformat(last_value.replace('Z', '+00:00'))
+    return sort_column, direction == 'desc', last_value, last_id
+
+
+def keyset_filter(col, desc, last_value, last_id):
+    # Rows that come after (last_value, last_id); ID breaks ties between equal values.
+    # SQLite sorts NULLs first in ascending order and last in descending order.
+    if desc:
+        if last_value is None:
+            return db.and_(col.is_(None), Book.id < last_id)
+        return db.or_(col < last_value, db.and_(col == last_value, Book.id < last_id), col.is_(None))
+    if last_value is None:
+        return db.or_(col.isnot(None), db.and_(col.is_(None), Book.id > last_id))
+    return db.or_(col > last_value, db.and_(col == last_value, Book.id > last_id))
+
+
+# =============================================================================
+# HTTP CACHING (ETag)
+# =============================================================================
+# An ETag is a version tag for a response. Clients send it back in If-None-Match
+# and get an empty 304 Not Modified if nothing changed since, which saves both
+# building the JSON and sending it.
+
+def not_modified(etag):  # 304 response if the client already has this version, else None
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+
+def books_etag():  # Returns (etag, total number of books); the etag changes on any add/edit/delete
+    latest, total = db.session.execute(
+        db.select(db.func.max(Book.updated_at), db.func.count()).select_from(Book)
+    ).one()
+    return hashlib.md5(f'{latest}|{total}|{request.full_path}'.encode()).hexdigest(), total
+
+
 # =============================================================================
 # REST API ROUTES
 # =============================================================================
 
 # GET /api/books - Get all books with sorting and pagination
+# ?after=<cursor> uses fast keyset pagination, ?page=<n> uses classic OFFSET pagination
 @app.route('/api/books', methods=['GET'])
 def get_books():
     # 1. Get query parameters for sorting
@@ -59,134 +330,205 @@ def get_books():
     order = request.args.get('order', 'asc')      # Default order is ascending
 
     # 2. Get query parameters for pagination
+    after = request.args.get('after')             # Cursor from a previous response
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
-
-    # 3. Build the base query
-    query = Book.query
+    per_page = max(request.args.get('per_page', 10, type=int), 1)
+
+    # 3. Nothing to send if the client's copy is still current
+    etag, total = books_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # 4. Build the base query
+    query = db.select(*BOOK_COLS)
+
+    # 5. Apply Sorting logic
+    # Only whitelisted columns can be sorted on; anything else falls back to ID
+    if sort_column not in SORTABLE_COLUMNS:
+        sort_column = 'id'
+    col = SORTABLE_COLUMNS[sort_column]
+    desc = order[:1] in ('d', 'D')  # Only the first letter matters, no order.lower() copy
+    if desc:
+        query = query.order_by(col.desc(), Book.id.desc())  # ID keeps the order stable
+    else:
+        query = query.order_by(col.asc(), Book.id.asc())
+
+    # 6a. Keyset pagination: continue right after the row the cursor points at
+    if after:
+        try:
+            cursor_sort, cursor_desc, last_value, last_id = decode_cursor(after)
+        except (ValueError, TypeError):
+            return ojsonify({'success': False, 'error': 'Invalid cursor'}, 400)
+        if cursor_sort != sort_column:
+            return ojsonify({'success': False, 'error': 'Cursor does not match sort column'}, 400)
+        if cursor_desc != desc:
+            return ojsonify({'success': False, 'error': 'Cursor does not match sort order'}, 400)
+
+        query = query.where(keyset_filter(col, desc, last_value, last_id))
+        # One extra row tells us if there is a next page
+        rows = db.session.execute(query.limit(per_page + 1)).all()
+        has_next = len(rows) > per_page
+        books = [BookOut(*row) for row in rows[:per_page]]
+
+        response = books_jsonify(
+            books,
+            count=len(books),
+            sort=sort_column,
+            order=order,
+            next_cursor=encode_cursor(sort_column, desc, books[-1]) if has_next else None,
+        )
+        response.set_etag(etag, weak=True)
+        return response
+
+    # 6b. Classic OFFSET pagination (slower for deep pages)
+    # The total already came from books_etag(), so unlike paginate() there is no
+    # second SELECT COUNT(*) query
+    page = max(page, 1)
+    rows = db.session.execute(query.limit(per_page).offset((page - 1) * per_page)).all()
+    total_pages = ceil(total / per_page)
+
+    books = [BookOut(*row) for row in rows]
+
+    response = books_jsonify(
+        books,
+        count=len(books),
+        total_books=total,
+        total_pages=total_pages,
+        current_page=page,
+        sort=sort_column,
+        order=order,
+        next_cursor=encode_cursor(sort_column, desc, books[-1]) if page < total_pages else None,
+    )
+    response.set_etag(etag, weak=True)
+    return response
 
-    # 4. Apply Sorting logic
-    # Check if the requested column exists in the Book model to avoid errors
-    if hasattr(Book, sort_column):
-        col = getattr(Book, sort_column)
-        if order.lower() == 'desc':
-            query = query.order_by(col.desc())
-        else:
-            query = query.order_by(col.asc())
 
-    # 5. Apply Pagination
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    books = pagination.items
+# GET /api/books/stream - Stream every book as newline-delimited JSON (one book per line)
+# Memory use stays flat no matter how many books there are
+@app.route('/api/books/stream', methods=['GET'])
+def stream_books():
+    def generate():
+        # yield_per fetches rows from the database cursor 500 at a time
+        query = db.select(*BOOK_COLS).order_by(Book.id).execution_options(yield_per=500)
+        for row in db.session.execute(query):
+            yield _BOOKS_ENCODER.encode(BookOut(*row)) + b'\n'
 
-    return jsonify({
-        'success': True,
-        'count': len(books),
-        'total_books': pagination.total,
-        'total_pages': pagination.pages,
-        'current_page': pagination.page,
-        'sort': sort_column,
-        'order': order,
-        'books': [book.to_dict() for book in books]
-    })
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 
 # GET /api/books/<id> - Get single book
 @app.route('/api/books/<int:id>', methods=['GET'])
 def get_book(id):
-    book = Book.query.get(id)
+    book = db.session.execute(db.select(*BOOK_COLS).where(Book.id == id)).mappings().first()
 
     if not book:
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': 'Book not found'
-        }), 404  # Return 404 status code
+        }, 404)  # Return 404 status code
 
-    return jsonify({
+    etag = f'{id}-{int(book["updated_at"].timestamp() * 1_000_000)}'
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    response = ojsonify({
         'success': True,
-        'book': book.to_dict()
+        'book': dict(book)
     })
+    response.set_etag(etag, weak=True)
+    return response
 
 
 # POST /api/books - Create new book
 @app.route('/api/books', methods=['POST'])
 def create_book():
-    data = request.get_json()  # Get JSON data from request body
+    body = request.get_data(cache=False)  # Raw JSON bytes from the request body
 
     # Validation
-    if not data:
-        return jsonify({'success': False, 'error': 'No data provided'}), 400
+    if not body:
+        return ojsonify({'success': False, 'error': 'No data provided'}, 400)
 
-    if not data.get('title') or not data.get('author'):
-        return jsonify({'success': False, 'error': 'Title and author are required'}), 400
+    try:
+        data = BOOK_IN_DECODER.decode(body)  # Parse + validate in one step
+    except msgspec.DecodeError as e:  # Malformed JSON, missing title/author, wrong types...
+        return ojsonify({'success': False, 'error': str(e)}, 400)
 
     # Check for duplicate ISBN
-    if data.get('isbn'):
-        existing = Book.query.filter_by(isbn=data['isbn']).first()
-        if existing:
-            return jsonify({'success': False, 'error': 'ISBN already exists'}), 400
+    if data.isbn:
+        # EXISTS returns a single true/false instead of loading the whole matching row
+        exists_stmt = db.select(db.exists().where(Book.isbn == data.isbn))
+        if db.session.scalar(exists_stmt):
+            return ojsonify({'success': False, 'error': 'ISBN already exists'}, 400)
 
     # Create book
     new_book = Book(
-        title=data['title'],
-        author=data['author'],
-        year=data.get('year'),  # Optional field
-        isbn=data.get('isbn')
+        title=data.title,
+        author=data.author,
+        year=data.year,  # Optional field
+        isbn=data.isbn
     )
 
     db.session.add(new_book)
-    db.session.commit()
+    db.session.flush()              # Sends the INSERT, so new_book.id is set
+    book_data = new_book.to_dict()  # Read before commit(), which expires the object
+    db.session.commit()             # (reading it afterwards would cost another SELECT)
 
-    return jsonify({
+    return ojsonify({
         'success': True,
         'message': 'Book created successfully',
-        'book': new_book.to_dict()
-    }), 201  # 201 = Created
+        'book': book_data
+    }, 201)  # 201 = Created
 
 
 # PUT /api/books/<id> - Update book
 @app.route('/api/books/<int:id>', methods=['PUT'])
 def update_book(id):
-    book = Book.query.get(id)
+    book = db.session.get(Book, id)  # Primary-key lookup, uses the session's identity map
 
     if not book:
-        return jsonify({'success': False, 'error': 'Book not found'}), 404
+        return ojsonify({'success': False, 'error': 'Book not found'}, 404)
+
+    body = request.get_data(cache=False)
 
-    data = request.get_json()
+    if not body:
+        return ojsonify({'success': False, 'error': 'No data provided'}, 400)
 
-    if not data:
-        return jsonify({'success': False, 'error': 'No data provided'}), 400
+    try:
+        data = BOOK_PATCH_DECODER.decode(body)
+    except msgspec.DecodeError as e:
+        return ojsonify({'success': False, 'error': str(e)}, 400)
 
     # Update fields if provided
-    if 'title' in data:
-        book.title = data['title']
-    if 'author' in data:
-        book.author = data['author']
-    if 'year' in data:
-        book.year = data['year']
-    if 'isbn' in data:
-        book.isbn = data['isbn']
+    for field in BookPatch.__struct_fields__:
+        value = getattr(data, field)
+        if value is not msgspec.UNSET:
+            setattr(book, field, value)
 
+    db.session.flush()
+    book_data = book.to_dict()  # Before commit(), like in create_book()
     db.session.commit()
 
-    return jsonify({
+    return ojsonify({
         'success': True,
         'message': 'Book updated successfully',
-        'book': book.to_dict()
+        'book': book_data
     })
 
 
 # DELETE /api/books/<id> - Delete book
 @app.route('/api/books/<int:id>', methods=['DELETE'])
 def delete_book(id):
-    book = Book.query.get(id)
+    book = db.session.get(Book, id)
 
     if not book:
-        return jsonify({'success': False, 'error': 'Book not found'}), 404
+        return ojsonify({'success': False, 'error': 'Book not found'}, 404)
 
     db.session.delete(book)
     db.session.commit()
 
-    return jsonify({
+    return ojsonify({
         'success': True,
         'message': 'Book deleted successfully'
     })
@@ -199,39 +541,41 @@ def delete_book(id):
 # GET /api/books/search?q=python&author=john
 @app.route('/api/books/search', methods=['GET'])
 def search_books():
-    query = Book.query
+    etag, _ = books_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    query = db.select(*BOOK_COLS)
 
     # Filter by title (partial match)
     title = request.args.get('q')  # Query parameter: ?q=python
     if title:
-        query = query.filter(Book.title.ilike(f'%{title}%'))  # Case-insensitive LIKE
+        query = query.where(fts_filter(Book.title, book_fts.c.title, title))
 
     # Filter by author
     author = request.args.get('author')
     if author:
-        query = query.filter(Book.author.ilike(f'%{author}%'))
+        query = query.where(fts_filter(Book.author, book_fts.c.author, author))
 
     # Filter by year
     year = request.args.get('year')
     if year:
-        query = query.filter_by(year=int(year))
+        query = query.where(Book.year == int(year))
 
-    books = query.all()
+    books = [BookOut(*row) for row in db.session.execute(query)]
 
-    return jsonify({
-        'success': True,
-        'count': len(books),
-        'books': [book.to_dict() for book in books]
-    })
+    response = books_jsonify(books, count=len(books))
+    response.set_etag(etag, weak=True)
+    return response
 
 
 # =============================================================================
 # SIMPLE WEB PAGE FOR TESTING
 # =============================================================================
 
-@app.route('/')
-def index():
-    return '''
+# The page never changes, so it is encoded to bytes and fingerprinted once at startup
+INDEX_HTML = '''
     <!DOCTYPE html>
     <html>
     <head>
@@ -369,26 +713,79 @@ def index():
     </body>
     </html>
     '''
+_INDEX_BYTES = INDEX_HTML.encode('utf-8')
+_INDEX_ETAG = hashlib.md5(_INDEX_BYTES).hexdigest()
+_INDEX_ENCODED = {  # Compressed once here instead of by Compress on every request
+    'br': brotli.compress(_INDEX_BYTES),
+    'gzip': gzip.compress(_INDEX_BYTES, mtime=0),  # No timestamp: same bytes in every worker
+}
+
+
+@app.route('/')
+def index():
+    encoding = request.accept_encodings.best_match(_INDEX_ENCODED)  # 'br', 'gzip' or None
+    response = Response(_INDEX_ENCODED.get(encoding, _INDEX_BYTES), mimetype='text/html',
+                        headers={'Cache-Control': 'public, max-age=3600'})
+    if encoding:
+        response.headers['Content-Encoding'] = encoding  # Compress leaves it alone
+        response.set_etag(f'{_INDEX_ETAG}:{encoding}')   # Same ETag format Compress uses
+    else:
+        response.set_etag(_INDEX_ETAG)
+    return response.make_conditional(request)  # 304 with no body if the browser's copy is current
+
+
 # =============================================================================
 # INITIALIZE DATABASE WITH SAMPLE DATA
 # =============================================================================
 
+def upgrade_db():  # Adds columns introduced after a database was first created
+    # create_all() only creates missing tables, it never adds columns to existing ones
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('book')}
+    if 'updated_at' not in columns:
+        db.session.execute(db.text('ALTER TABLE book ADD COLUMN updated_at DATETIME'))
+        db.session.execute(db.text('UPDATE book SET updated_at = created_at'))  # Backfill
+        db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_book_updated_at ON book (updated_at)'))
+        db.session.commit()
+        print('Added updated_at column to existing database!')
+
+
 def init_db():
     with app.app_context():
         db.create_all()
+        upgrade_db()
+        create_search_index()
 
         if Book.query.count() == 0:
             sample_books = [
-                Book(title='Python Crash Course', author='Eric Matthes', year=2019, isbn='978-1593279288'),
-                Book(title='Flask Web Development', author='Miguel Grinberg', year=2018, isbn='978-1491991732'),
-                Book(title='Clean Code', author='Robert C. Martin', year=2008, isbn='978-0132350884'),
+                {'title': 'Python Crash Course', 'author': 'Eric Matthes', 'year': 2019, 'isbn': '978-1593279288'},
+                {'title': 'Flask Web Development', 'author': 'Miguel Grinberg', 'year': 2018, 'isbn': '978-1491991732'},
+                {'title': 'Clean Code', 'author': 'Robert C. Martin', 'year': 2008, 'isbn': '978-0132350884'},
             ]
-            db.session.add_all(sample_books)
+            # Plain dicts inserted in one executemany, without creating Book objects
+            db.session.bulk_insert_mappings(Book, sample_books)
             db.session.commit()
             print('Sample books added!')
 
 
-if __name__ == '__main__':
+@app.cli.command('init-db')  # flask --app app init-db
+def init_db_command():
+    init_db()
+
+
+# =============================================================================
+# RUNNING IN PRODUCTION
+# =============================================================================
+#
+# The built-in server below is for development only. In production run the
+# app under gunicorn, with one process per CPU and 8 threads in each, so
+# requests waiting on the database don't hold up the others:
+#
+#   flask --app app init-db
+#   gunicorn -w $(nproc) -k gthread --threads 8 app:app
+#
+# =============================================================================
+
+if __name__ == '__main__':  # Development server: python app.py
     init_db()
     app.run(debug=True)
 
@@ -413,6 +810,7 @@ if __name__ == '__main__':
 # -----|------------------
 # 200  | OK (Success)
 # 201  | Created
+# 304  | Not Modified (client's cached copy is still current)
 # 400  | Bad Request (client error)
 # 404  | Not Found
 # 500  | Internal Server Error
@@ -422,7 +820,9 @@ if __name__ == '__main__':
 # =============================================================================
 #
 # jsonify()           - Convert Python dict to JSON response
+# ojsonify()          - Same as jsonify(), but serialized with orjson (faster)
 # request.get_json()  - Get JSON data from request body
+# Decoder.decode()    - msgspec: parse and validate a JSON body against a Struct
 # request.args.get()  - Get query parameters (?key=value)
 #
 # =============================================================================